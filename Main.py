@@ -1,14 +1,114 @@
 import streamlit as st
 import requests
 import pandas as pd
+import orjson
+import hashlib
 import time
 from io import StringIO
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
+# Shopify Admin API version used for every REST/GraphQL call
+SHOPIFY_API_VERSION = "2026-01"
+
+# How long fetched eOrder/Shopify data stays cached across reruns
+CACHE_TTL_SECONDS = 300
+
+# Concurrent bulk-update mutations in flight during a push; enough to keep
+# Shopify's cost bucket busy on the shared session without throttling
+MAX_CONCURRENT_UPDATES = 5
+
+# Back off once Shopify's GraphQL cost bucket drops below this many points
+MIN_AVAILABLE_COST_POINTS = 100
+THROTTLED_RETRIES = 3
+
+# How long a comparison is reused while the eOrder feed hasn't changed
+COMPARE_REUSE_SECONDS = 60
+
+# Polling schedule for the Shopify bulk product export
+BULK_POLL_INTERVAL_SECONDS = 2
+BULK_POLL_MAX_INTERVAL_SECONDS = 10
+BULK_QUERY_TIMEOUT_SECONDS = 600
+# Read the export in large chunks; iter_lines defaults to 512 bytes
+BULK_DOWNLOAD_CHUNK_BYTES = 64 * 1024
+
+def get_session(access_token=None, retry_post=True):
+    """
+    Shared HTTP session so repeated calls reuse pooled keep-alive connections.
+    The Shopify token is only attached when given, so it is never sent to eOrder.
+    Pass retry_post=False for POSTs that must not be sent twice.
+    """
+    # st.cache_resource keys on the arguments exactly as passed, so always pass
+    # both positionally: one session per token and retry mode, however called
+    return build_session(access_token, retry_post)
+
+@st.cache_resource
+def build_session(access_token, retry_post):
+    session = requests.Session()
+    # Bodies are pre-encoded with orjson, so the content type is set here once
+    session.headers.update({'Content-Type': 'application/json'})
+    if access_token:
+        session.headers.update({'X-Shopify-Access-Token': access_token})
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=32,
+        max_retries=Retry(
+            total=3,
+            backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504],
+            # Price mutations and status queries set or read absolute values,
+            # so POST is retried unless the caller opts out
+            allowed_methods=['GET', 'PUT', 'POST'] if retry_post else ['GET', 'PUT'],
+            raise_on_status=False
+        )
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)  # The eOrder URL may not be TLS
+    return session
+
+@st.cache_resource
+def get_conditional_get_cache():
+    """
+    Validators and parsed body of the last successful eOrder response per URL.
+    Outlives st.cache_data entries, so an expired entry can be revalidated
+    with a conditional GET instead of downloading the feed again.
+    """
+    return {}
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS, show_spinner="Fetching eOrder prices...")
 def fetch_eorder_prices(api_url):
+    conditional_get_cache = get_conditional_get_cache()
+    cached = conditional_get_cache.get(api_url)
+    headers = {}
+    if cached and cached['etag']:
+        headers['If-None-Match'] = cached['etag']
+    if cached and cached['last_modified']:
+        headers['If-Modified-Since'] = cached['last_modified']
+
     try:
-        response = requests.get(api_url)
+        response = get_session().get(api_url, headers=headers)
+        if response.status_code == 304 and cached:
+            return cached['eorder_prices']
         if response.status_code == 200:
-            return response.json()
+            eorder_prices = orjson.loads(response.content)
+            # compare_prices needs a list of {'sku': ..., 'price': ...} items
+            if not isinstance(eorder_prices, list) or not all(
+                isinstance(item, dict) and 'sku' in item and 'price' in item
+                for item in eorder_prices
+            ):
+                st.error("Unexpected eOrder response: expected a list of items with 'sku' and 'price'.")
+                st.json(eorder_prices)
+                return None
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+            if etag or last_modified:
+                conditional_get_cache[api_url] = {
+                    'etag': etag,
+                    'last_modified': last_modified,
+                    'eorder_prices': eorder_prices
+                }
+            return eorder_prices
         else:
             st.error(f"Failed to fetch data from eOrder. HTTP Status Code: {response.status_code}")
             try:
@@ -20,112 +120,295 @@ def fetch_eorder_prices(api_url):
         st.error(f"An error occurred while fetching eOrder prices: {e}")
         return None
 
-def get_shopify_products(shop_url, access_token, api_version="2024-01"):
-    all_products = []
-    next_page_url = f"https://{shop_url}/admin/api/{api_version}/products.json?limit=250"
-    
-    while next_page_url:
-        try:
-            response = requests.get(
-                next_page_url,
-                headers={
-                    'X-Shopify-Access-Token': access_token,
-                    'Content-Type': 'application/json'
-                }
-            )
-            
-            if response.status_code != 200:
-                st.error(f"Failed to fetch products. Status: {response.status_code}")
-                try:
-                    st.json(response.json())  # Display error details
-                except:
-                    st.write(response.text)
+PRODUCTS_BULK_QUERY = """
+{
+  products {
+    edges {
+      node {
+        id
+        title
+        variants {
+          edges {
+            node { id title sku price selectedOptions { value } }
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+BULK_OPERATION_RUN_QUERY = """
+mutation bulkOperationRunQuery($query: String!) {
+  bulkOperationRunQuery(query: $query) {
+    bulkOperation { id status }
+    userErrors { field message }
+  }
+}
+"""
+
+BULK_OPERATION_STATUS = """
+query bulkOperationStatus($id: ID!) {
+  node(id: $id) {
+    ... on BulkOperation { id status errorCode url }
+  }
+}
+"""
+
+def post_shopify_graphql(shop_url, access_token, query, variables, api_version=SHOPIFY_API_VERSION, retry_post=True):
+    """
+    POST a query to the Shopify Admin GraphQL API and return its `data`,
+    raising RuntimeError on HTTP or top-level GraphQL errors.
+    """
+    response = get_session(access_token, retry_post).post(
+        f"https://{shop_url}/admin/api/{api_version}/graphql.json",
+        data=orjson.dumps({"query": query, "variables": variables})
+    )
+    if response.status_code != 200:
+        raise RuntimeError(f"HTTP {response.status_code}: {response.text}")
+    data = orjson.loads(response.content)
+    if data.get('errors'):
+        raise RuntimeError(str(data['errors']))
+    return data['data']
+
+# Field order of the variant rows returned by get_shopify_variants
+VARIANT_COLUMNS = [
+    'product_id', 'variant_id', 'product_title', 'variant_title',
+    'current_price', 'sku', 'option1', 'option2', 'option3'
+]
+
+# The leading underscore keeps the access token out of Streamlit's cache key
+@st.cache_data(ttl=CACHE_TTL_SECONDS, show_spinner=False)
+def get_shopify_variants(shop_url, _access_token, api_version=SHOPIFY_API_VERSION):
+    """
+    Export the catalog with a GraphQL bulk operation: one submission, a few
+    status polls and one JSONL download of just the fields compare_prices reads,
+    instead of paging through full REST product payloads. Returns one
+    VARIANT_COLUMNS tuple per variant that has a SKU, or None, plus an error
+    message. It runs on a worker thread, so it never writes to the page.
+    """
+    try:
+        started = post_shopify_graphql(
+            shop_url, _access_token, BULK_OPERATION_RUN_QUERY,
+            {"query": PRODUCTS_BULK_QUERY}, api_version,
+            # Starting an export isn't idempotent: a retry after Shopify accepted
+            # the first attempt would start a second one or fail as in progress
+            retry_post=False
+        )['bulkOperationRunQuery']
+        if started['userErrors']:
+            return None, f"Failed to start Shopify product export: {started['userErrors']}"
+        operation_id = started['bulkOperation']['id']
+
+        poll_interval = BULK_POLL_INTERVAL_SECONDS
+        deadline = time.time() + BULK_QUERY_TIMEOUT_SECONDS
+        while True:
+            time.sleep(poll_interval)
+            operation = post_shopify_graphql(
+                shop_url, _access_token, BULK_OPERATION_STATUS,
+                {"id": operation_id}, api_version
+            )['node']
+            if operation['status'] == 'COMPLETED':
                 break
-            
-            data = response.json()
-            all_products.extend(data['products'])
-            
-            # Check for pagination link in headers
-            next_page_url = None
-            if 'Link' in response.headers:
-                links = response.headers['Link'].split(', ')
-                for link in links:
-                    if 'rel="next"' in link:
-                        next_page_url = link.split(';')[0].strip('<>')
-        
-        except Exception as e:
-            st.error(f"Error fetching Shopify products: {e}")
-            break
-    
-    return all_products
-
-def compare_prices(eorder_prices, shopify_products):
-    price_updates = []
-    
-    # Create a dictionary of eOrder prices for quick lookup
-    eorder_price_map = {item['sku']: float(item['price']) for item in eorder_prices}
-    
-    for product in shopify_products:
-        for variant in product['variants']:
-            sku = variant.get('sku', '')
-            if sku in eorder_price_map:
-                current_price = float(variant['price'])
-                new_price = eorder_price_map[sku]
-                option1 = variant.get('option1', '')
-                option2 = variant.get('option2', '')
-                option3 = variant.get('option3', '')
-                
-                if abs(current_price - new_price) > 0.01:
-                    price_updates.append({
-                        'product_id': product['id'],   # numeric ID from REST
-                        'variant_id': variant['id'],   # numeric ID from REST
-                        'product_title': product['title'],
-                        'variant_title': variant['title'],
-                        'current_price': current_price,
-                        'new_price': new_price,
-                        'sku': sku,
-                        'option1': option1,
-                        'option2': option2,
-                        'option3': option3
-                    })
-    return price_updates
-
-def update_shopify_price(shop_url, access_token, variant_id, new_price, api_version="2024-01"):
-    """
-    Update variant price using Shopify Admin REST API.
-    """
-    update_endpoint = f"https://{shop_url}/admin/api/{api_version}/variants/{variant_id}.json"
-    headers = {
-        'X-Shopify-Access-Token': access_token,
-        'Content-Type': 'application/json'
+            if operation['status'] in ('FAILED', 'CANCELED', 'EXPIRED'):
+                return None, f"Shopify product export {operation['status'].lower()}: {operation['errorCode']}"
+            if time.time() > deadline:
+                return None, "Timed out waiting for the Shopify product export."
+            poll_interval = min(poll_interval * 2, BULK_POLL_MAX_INTERVAL_SECONDS)
+
+        # A completed export with no matching objects has no result file
+        if not operation['url']:
+            return [], None
+
+        # The result URL is pre-signed storage, so don't send it the Shopify token;
+        # the with block releases the pooled connection on every exit path
+        with get_session().get(operation['url'], stream=True) as response:
+            if response.status_code != 200:
+                return None, f"Failed to download Shopify product export. Status: {response.status_code}"
+
+            # Each JSONL line is a product, or a variant pointing at its product via
+            # __parentId; products come first, so variants become flat rows directly
+            product_titles = {}
+            variant_rows = []
+            for line in response.iter_lines(chunk_size=BULK_DOWNLOAD_CHUNK_BYTES):
+                if not line:
+                    continue
+                record = orjson.loads(line)
+                parent_id = record.get('__parentId')
+                if parent_id is None:
+                    product_titles[record['id']] = record['title']
+                    continue
+                # Variants without a SKU can never match eOrder, so skip them up front
+                if not record['sku']:
+                    continue
+                options = [option['value'] for option in record['selectedOptions']]
+                options += [None] * (3 - len(options))
+                variant_rows.append((
+                    parent_id,
+                    record['id'],
+                    product_titles[parent_id],
+                    record['title'],
+                    record['price'],
+                    record['sku'],
+                    options[0],
+                    options[1],
+                    options[2]
+                ))
+            return variant_rows, None
+
+    except Exception as e:
+        return None, f"Error fetching Shopify products: {e}"
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS)
+def build_eorder_price_series(eorder_prices):
+    """
+    eOrder prices as a Series indexed by SKU, cached so reruns skip the rebuild,
+    plus the number of duplicate SKU rows that were dropped from the feed.
+    """
+    eorder_df = pd.DataFrame(eorder_prices)
+    # SKUs may arrive as JSON numbers; compare them as text like Shopify's
+    eorder_df['sku'] = eorder_df['sku'].astype('string').str.strip()
+    # Rows without a SKU can never match a variant, so keep them out of the index
+    eorder_df = eorder_df[eorder_df['sku'].notna() & (eorder_df['sku'] != '')]
+    # A SKU listed more than once takes the feed's last price, before any
+    # comparison, so an older duplicate can never be the one that gets pushed
+    duplicate_count = int(eorder_df['sku'].duplicated().sum())
+    eorder_df = eorder_df.drop_duplicates('sku', keep='last')
+    eorder_price_series = pd.Series(
+        pd.to_numeric(eorder_df['price'], errors='coerce').values,
+        index=eorder_df['sku'],
+        name='new_price'
+    ).dropna()
+    return eorder_price_series, duplicate_count
+
+UPDATE_COLUMNS = [
+    'product_id', 'variant_id', 'product_title', 'variant_title',
+    'current_price', 'new_price', 'sku', 'option1', 'option2', 'option3'
+]
+
+# Columns shown in the preview table; ids are only needed for the push
+DISPLAY_COLUMNS = ['sku', 'product_title', 'variant_title', 'current_price', 'new_price']
+
+def compare_prices(eorder_prices, shopify_variants):
+    """
+    Join Shopify variants to eOrder prices on SKU and keep the rows whose price
+    differs once both are rounded to whole cents. Done as one pandas join rather
+    than a Python loop over every variant; the DataFrame is returned as-is so
+    it can be displayed and kept in session state without conversion.
+    """
+    if not eorder_prices or not shopify_variants:
+        return pd.DataFrame(columns=UPDATE_COLUMNS)
+
+    variants_df = pd.DataFrame.from_records(shopify_variants, columns=VARIANT_COLUMNS)
+
+    # Stray whitespace in either system's SKUs shouldn't prevent a match, and
+    # unparseable prices can't be compared, so drop them instead of pushing NaN
+    variants_df = variants_df.assign(
+        sku=variants_df['sku'].astype('string').str.strip(),
+        current_price=pd.to_numeric(variants_df['current_price'], errors='coerce')
+    )
+    variants_df = variants_df[(variants_df['sku'] != '') & variants_df['current_price'].notna()]
+    eorder_price_series, _ = build_eorder_price_series(eorder_prices)
+
+    merged = variants_df.join(eorder_price_series, on='sku', how='inner')
+    # Compare whole cents so float noise like 19.999 vs 20.00 isn't pushed
+    current_cents = (merged['current_price'] * 100).round().astype('int64')
+    new_cents = (merged['new_price'] * 100).round().astype('int64')
+    changed = current_cents != new_cents
+    updates = merged[changed].assign(new_price=new_cents[changed] / 100)
+
+    return updates[UPDATE_COLUMNS].reset_index(drop=True)
+
+def group_updates_by_product(price_updates):
+    """
+    Group price updates by product so one bulk mutation covers all of a
+    product's changed variants.
+    """
+    return {
+        product_id: group.to_dict('records')
+        for product_id, group in price_updates.groupby('product_id', sort=False)
     }
+
+PRODUCT_VARIANTS_BULK_UPDATE = """
+mutation productVariantsBulkUpdate($productId: ID!, $variants: [ProductVariantsBulkInput!]!) {
+  productVariantsBulkUpdate(productId: $productId, variants: $variants) {
+    productVariants { id price }
+    userErrors { field message }
+  }
+}
+"""
+
+def graphql_throttle_delay(data):
+    """
+    Seconds to wait for Shopify's GraphQL cost bucket to refill to
+    MIN_AVAILABLE_COST_POINTS, based on the throttle status in the response.
+    """
+    throttle_status = data.get('extensions', {}).get('cost', {}).get('throttleStatus')
+    if not throttle_status:
+        return 0
+    available = throttle_status['currentlyAvailable']
+    if available >= MIN_AVAILABLE_COST_POINTS:
+        return 0
+    return (MIN_AVAILABLE_COST_POINTS - available) / throttle_status['restoreRate']
+
+def update_shopify_variant_prices(shop_url, access_token, product_id, variant_updates, api_version=SHOPIFY_API_VERSION):
+    """
+    Update the prices of all changed variants of one product with a single
+    productVariantsBulkUpdate call to the Shopify Admin GraphQL API.
+    Runs on worker threads, so results are returned for the caller to display
+    instead of being written to the page here.
+    """
+    graphql_endpoint = f"https://{shop_url}/admin/api/{api_version}/graphql.json"
     payload = {
-        "variant": {
-            "id": variant_id,
-            "price": f"{new_price:.2f}"
+        "query": PRODUCT_VARIANTS_BULK_UPDATE,
+        "variables": {
+            "productId": product_id,
+            "variants": [
+                {
+                    "id": update['variant_id'],
+                    "price": f"{update['new_price']:.2f}"
+                }
+                for update in variant_updates
+            ]
         }
     }
 
     try:
-        response = requests.put(
-            update_endpoint,
-            headers=headers,
-            json=payload
-        )
-        if response.status_code == 200:
-            st.success(f"Successfully updated Variant ID: {variant_id} to price ${new_price:.2f}")
-            return True, response.json()
-        else:
-            st.error(f"Failed to update Variant ID {variant_id}. Status: {response.status_code}")
-            try:
-                st.json(response.json())  # Display the error message if available
-            except:
-                st.write(response.text)
-            return False, response.text
+        for attempt in range(THROTTLED_RETRIES + 1):
+            # 429s are retried by the session adapter, honouring Retry-After
+            response = get_session(access_token).post(graphql_endpoint, data=orjson.dumps(payload))
+            if response.status_code != 200:
+                return False, f"HTTP {response.status_code}: {response.text}"
+
+            data = orjson.loads(response.content)
+            delay = graphql_throttle_delay(data)
+            throttled = any(
+                error.get('extensions', {}).get('code') == 'THROTTLED'
+                for error in data.get('errors', [])
+            )
+            if throttled and attempt < THROTTLED_RETRIES:
+                time.sleep(max(delay, 1))
+                continue
+            # Let the bucket refill before this worker sends its next mutation
+            if delay:
+                time.sleep(delay)
+            break
+
+        if data.get('errors'):
+            return False, str(data['errors'])
+
+        result = data['data']['productVariantsBulkUpdate']
+        # The mutation is all-or-nothing, so any user error fails the whole product
+        if result['userErrors']:
+            return False, "; ".join(
+                f"{'.'.join(error['field'] or [])}: {error['message']}"
+                for error in result['userErrors']
+            )
+        return True, result
     except Exception as e:
-        st.error(f"Exception occurred while updating Variant ID {variant_id}: {e}")
         return False, str(e)
 
+FAILED_COLUMNS = ['sku', 'variant_id', 'error']
+
 def main():
     st.title("Victron Energy Price Synchronization")
     st.write("Compare and synchronize prices between eOrder API and Shopify Storefront")
@@ -139,89 +422,164 @@ def main():
         st.error(f"Missing secret: {e}. Please configure Streamlit secrets.")
         return
 
-    # Fetch eOrder Prices
-    st.write("Fetching prices from eOrder API...")
-    eorder_prices = fetch_eorder_prices(eorder_api_url)
-    
-    if not eorder_prices:
-        st.error("Could not fetch prices from eOrder API.")
-        return
+    # Fetched data is cached across reruns; let the operator force a reload
+    if st.sidebar.button("🔄 Refresh data"):
+        st.cache_data.clear()
+        st.session_state.pop('last_compare', None)
+        st.session_state.pop('pushed_prices', None)
 
-    # Fetch Shopify Products
-    st.write("Fetching Shopify products...")
-    shopify_products = get_shopify_products(shopify_shop, shopify_access_token)
-    
-    if not shopify_products:
-        st.error("Could not fetch Shopify products.")
-        return
+    last_compare = st.session_state.get('last_compare')
+    compare_is_recent = (
+        last_compare is not None
+        and time.time() - last_compare['timestamp'] < COMPARE_REUSE_SECONDS
+    )
 
-    # Compare Prices
-    price_updates = compare_prices(eorder_prices, shopify_products)
+    # The two fetches are independent, so unless a recent comparison might make
+    # the Shopify catalog unnecessary, export it while eOrder prices download.
+    # The worker doesn't render anything; all page output stays on this thread.
+    executor = ThreadPoolExecutor(max_workers=1)
+    try:
+        shopify_future = None
+        if not compare_is_recent:
+            shopify_future = executor.submit(get_shopify_variants, shopify_shop, shopify_access_token)
+
+        # Fetch eOrder Prices
+        eorder_prices = fetch_eorder_prices(eorder_api_url)
+        
+        if not eorder_prices:
+            fetch_eorder_prices.clear()  # Don't keep a failed fetch cached
+            st.error("Could not fetch prices from eOrder API.")
+            return
+
+        # Reuse a recent comparison when the eOrder feed is unchanged, skipping
+        # the Shopify catalog fetch and compare altogether
+        eorder_hash = hashlib.sha256(orjson.dumps(eorder_prices, option=orjson.OPT_SORT_KEYS)).hexdigest()
+        if compare_is_recent and last_compare['eorder_hash'] == eorder_hash:
+            price_updates = last_compare['price_updates']
+        else:
+            # Fetch Shopify Products
+            with st.spinner("Fetching Shopify products..."):
+                if shopify_future is None:
+                    shopify_variants, shopify_error = get_shopify_variants(shopify_shop, shopify_access_token)
+                else:
+                    shopify_variants, shopify_error = shopify_future.result()
+            
+            # Failures return None; an empty list is a catalog with no SKU'd variants
+            if shopify_variants is None:
+                get_shopify_variants.clear()  # Don't keep a failed fetch cached
+                st.error(shopify_error)
+                st.error("Could not fetch Shopify products.")
+                return
+
+            # Compare Prices
+            price_updates = compare_prices(eorder_prices, shopify_variants)
+            st.session_state['last_compare'] = {
+                'eorder_hash': eorder_hash,
+                'timestamp': time.time(),
+                'price_updates': price_updates
+            }
+    finally:
+        # Don't hold the run open for an export whose result is no longer needed;
+        # if it is still running it finishes in the background
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    # Hide variants an interrupted push already updated to this exact price,
+    # so pushing again resumes instead of starting over
+    pushed_prices = st.session_state.setdefault('pushed_prices', {})
+    if pushed_prices:
+        already_pushed = price_updates['variant_id'].map(pushed_prices) == price_updates['new_price']
+        price_updates = price_updates[~already_pushed]
+
+    # Repeated eOrder SKUs are collapsed to their last price before comparing
+    _, duplicate_sku_count = build_eorder_price_series(eorder_prices)
+    if duplicate_sku_count:
+        st.warning(
+            f"Skipped {duplicate_sku_count} duplicate SKU rows in the eOrder feed; "
+            "the last price listed for each SKU is used."
+        )
 
     # Display Potential Price Updates
     st.header("Potential Price Updates")
-    if price_updates:
-        update_df = pd.DataFrame(price_updates)
-        st.dataframe(update_df)
+    if not price_updates.empty:
+        st.dataframe(
+            price_updates,
+            width="stretch",
+            hide_index=True,
+            column_order=DISPLAY_COLUMNS
+        )
         st.write(f"Total products that would be updated: {len(price_updates)}")
     else:
         st.success("No price updates needed!")
         return  # Exit if no updates are necessary
 
-    # Initialize error log
-    error_log = []
+    # Initialize error log; failures are written as they happen
+    error_log = StringIO()
 
     st.header("Push Updates to Shopify")
     st.write("Click the button below to push the above price updates to your Shopify store.")
 
     if st.button("Push Price Updates"):
-        if not price_updates:
+        if price_updates.empty:
             st.info("There are no price updates to push.")
             return
 
         progress_bar = st.progress(0)
         status_text = st.empty()
-        success_updates = []
-        failed_updates = []
-
-        total_updates = len(price_updates)
-        for idx, update in enumerate(price_updates, start=1):
-            status_text.text(f"Updating {idx}/{total_updates}: SKU {update['sku']}")
-
-            success, response = update_shopify_price(
-                shop_url=shopify_shop,
-                access_token=shopify_access_token,
-                variant_id=update['variant_id'],
-                new_price=update['new_price'],
-                api_version="2024-01"
-            )
+        success_count = 0
+        failed_rows = []
+
+        updates_by_product = group_updates_by_product(price_updates)
+        total_products = len(updates_by_product)
+        progress_step = max(1, total_products // 100)
+        executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_UPDATES)
+        try:
+            futures = {
+                executor.submit(
+                    update_shopify_variant_prices,
+                    shop_url=shopify_shop,
+                    access_token=shopify_access_token,
+                    product_id=product_id,
+                    variant_updates=variant_updates,
+                    api_version=SHOPIFY_API_VERSION
+                ): variant_updates
+                for product_id, variant_updates in updates_by_product.items()
+            }
 
-            if success:
-                success_updates.append(update)
-            else:
-                failed_updates.append({
-                    'sku': update['sku'],
-                    'variant_id': update['variant_id'],
-                    'error': response
-                })
-                # Append to error log
-                error_details = f"SKU: {update['sku']}, Variant ID: {update['variant_id']}, Error: {response}"
-                error_log.append(error_details)
-
-            progress_bar.progress(idx / total_updates)
-            time.sleep(0.1)  # Optional: simulate progress
+            for idx, future in enumerate(as_completed(futures), start=1):
+                variant_updates = futures[future]
+                success, response = future.result()
+
+                if success:
+                    success_count += len(variant_updates)
+                    for update in variant_updates:
+                        pushed_prices[update['variant_id']] = update['new_price']
+                else:
+                    for update in variant_updates:
+                        failed_rows.append((update['sku'], update['variant_id'], response))
+                        # Append to error log
+                        error_details = f"SKU: {update['sku']}, Variant ID: {update['variant_id']}, Error: {response}"
+                        error_log.write(error_details)
+                        error_log.write("\n")
+
+                # Redraw at most ~100 times so large pushes don't flood the websocket
+                if idx % progress_step == 0 or idx == total_products:
+                    status_text.text(f"Updated {idx}/{total_products} products: {variant_updates[0]['product_title']}")
+                    progress_bar.progress(idx / total_products)
+        finally:
+            # If a rerun interrupts the push, don't keep sending queued products
+            executor.shutdown(cancel_futures=True)
 
         status_text.text("Price updates completed.")
 
-        if success_updates:
-            st.success(f"Successfully updated {len(success_updates)} variants.")
-        if failed_updates:
-            st.error(f"Failed to update {len(failed_updates)} variants.")
-            failed_df = pd.DataFrame(failed_updates)
-            st.dataframe(failed_df)
+        if success_count:
+            st.success(f"Successfully updated {success_count} variants.")
+        if failed_rows:
+            st.error(f"Failed to update {len(failed_rows)} variants.")
+            failed_df = pd.DataFrame.from_records(failed_rows, columns=FAILED_COLUMNS)
+            st.dataframe(failed_df, width="stretch", hide_index=True)
 
             # Prepare error.txt content
-            error_content = "\n".join(error_log)
+            error_content = error_log.getvalue()
             st.download_button(
                 label="Download Error Log",
                 data=error_content,
@@ -232,5 +590,10 @@ def main():
         progress_bar.empty()
         status_text.empty()
 
+        # Shopify prices changed, so the cached catalog and comparison are stale
+        get_shopify_variants.clear()
+        st.session_state.pop('last_compare', None)
+        st.session_state.pop('pushed_prices', None)
+
 if __name__ == "__main__":
     main()